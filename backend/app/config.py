@@ -3,13 +3,15 @@ Application configuration using pydantic-settings.
 Reads from environment variables with sensible defaults.
 """
 
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from functools import lru_cache
 
 
 class Settings(BaseSettings):
     """Application settings loaded from environment variables."""
 
+    model_config = SettingsConfigDict(env_file=".env", case_sensitive=False)
+
     # Application
     app_name: str = "Metadata Quality Platform"
     environment: str = "development"
@@ -28,16 +30,15 @@ class Settings(BaseSettings):
     state_store_name: str = "statestore"
     object_store_name: str = "objectstore"
 
+    # Max keys held by the in-memory fallback when Dapr is unavailable
+    memory_store_max_items: int = 10_000
+
     # CORS settings
     cors_origins: str = "http://localhost:5173,http://localhost:8080"
 
     # Tenant (for multi-tenant deployments)
     atlan_tenant_id: str = "default"
 
-    class Config:
-        env_file = ".env"
-        case_sensitive = False
-
 
 @lru_cache()
 def get_settings() -> Settings:
@@ -12,8 +12,11 @@ Features:
 import os
 import logging
 from pathlib import Path
+from typing import Any
 from contextlib import asynccontextmanager
 
+import orjson
+
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, JSONResponse
@@ -32,14 +35,31 @@ logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson.
+    Defined here because FastAPI's own ORJSONResponse is deprecated.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan handler."""
     logger.info(f"Starting {settings.app_name}")
     logger.info(f"Environment: {settings.environment}")
     logger.info(f"Dapr HTTP port: {settings.dapr_http_port}")
+    # Shutdown closes the shared clients, so make sure each startup has open ones
+    if atlan_proxy.http_client.is_closed:
+        atlan_proxy.http_client = atlan_proxy.create_http_client()
+    if state_store.dapr_client.is_closed:
+        state_store.dapr_client = state_store.create_dapr_client()
     yield
     logger.info(f"Shutting down {settings.app_name}")
+    await atlan_proxy.http_client.aclose()
+    await state_store.dapr_client.aclose()
 
 
 # Create FastAPI application
@@ -48,6 +68,7 @@ app = FastAPI(
     description="Data quality scoring and analysis platform for Atlan metadata",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Configure CORS
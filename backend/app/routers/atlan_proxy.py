@@ -12,7 +12,7 @@ from typing import Any
 
 import httpx
 from fastapi import APIRouter, Request, HTTPException, Header
-from fastapi.responses import Response
+from fastapi.responses import StreamingResponse
 
 from ..config import get_settings
 
@@ -20,8 +20,15 @@ router = APIRouter()
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
-# Reusable HTTP client
-http_client = httpx.AsyncClient(timeout=60.0)
+
+def create_http_client() -> httpx.AsyncClient:
+    """Create the HTTP client used to reach the Atlan API."""
+    return httpx.AsyncClient(timeout=60.0)
+
+
+# Reusable HTTP client. Recreated on startup and closed on shutdown by the
+# app lifespan.
+http_client = create_http_client()
 
 
 @router.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
@@ -78,23 +85,15 @@ async def proxy_atlan_request(
     logger.info(f"Proxying {request.method} to {target_url}")
 
     try:
-        # Make request to Atlan
-        response = await http_client.request(
+        # Make request to Atlan, streaming the body instead of buffering it
+        upstream_request = http_client.build_request(
             method=request.method,
             url=target_url,
             headers=headers,
             content=body,
             params=query_params,
         )
-
-        # Return response with original status and headers
-        return Response(
-            content=response.content,
-            status_code=response.status_code,
-            headers={
-                "Content-Type": response.headers.get("Content-Type", "application/json"),
-            },
-        )
+        response = await http_client.send(upstream_request, stream=True)
 
     except httpx.TimeoutException:
         logger.error(f"Timeout proxying request to {target_url}")
@@ -103,3 +102,26 @@ async def proxy_atlan_request(
     except httpx.RequestError as e:
         logger.error(f"Error proxying request to {target_url}: {e}")
         raise HTTPException(status_code=502, detail=f"Failed to connect to Atlan API: {str(e)}")
+
+    async def stream_body():
+        # Always release the upstream connection, including when the body
+        # read fails or the client disconnects mid-stream
+        try:
+            async for chunk in response.aiter_bytes():
+                yield chunk
+        except httpx.HTTPError as e:
+            # Re-raise so the server aborts the response rather than ending
+            # a 200 cleanly with a truncated body
+            logger.error(f"Error streaming response from {target_url}: {e}")
+            raise
+        finally:
+            await response.aclose()
+
+    # Return response with original status and headers
+    return StreamingResponse(
+        stream_body(),
+        status_code=response.status_code,
+        headers={
+            "Content-Type": response.headers.get("Content-Type", "application/json"),
+        },
+    )
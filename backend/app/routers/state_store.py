@@ -5,13 +5,17 @@ Provides REST API for persisting application state using Dapr sidecar.
 When Dapr is not available, falls back to in-memory storage for development.
 """
 
-import json
+import calendar
 import logging
-from datetime import datetime
+import time
+from datetime import datetime, timezone
 from typing import Any
 
 import httpx
-from fastapi import APIRouter, HTTPException
+import orjson
+from cachetools import LRUCache
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
 from pydantic import BaseModel
 
 from ..config import get_settings
@@ -20,14 +24,42 @@ router = APIRouter()
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
-# In-memory fallback for when Dapr is not available
-_memory_store: dict[str, Any] = {}
+# In-memory fallback for when Dapr is not available, capped so long-running
+# dev containers don't grow without bound
+_memory_store: LRUCache = LRUCache(maxsize=settings.memory_store_max_items)
 
 # Dapr sidecar base URL
 DAPR_URL = f"http://localhost:{settings.dapr_http_port}"
 
-# HTTP client for Dapr
-dapr_client = httpx.AsyncClient(timeout=10.0)
+# Dapr state API path for the configured store
+STATE_PATH = f"/v1.0/state/{settings.state_store_name}"
+
+# Bodies are encoded with orjson and sent as raw content
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def create_dapr_client() -> httpx.AsyncClient:
+    """Create the HTTP client for Dapr, keeping sidecar connections alive."""
+    return httpx.AsyncClient(
+        base_url=DAPR_URL,
+        timeout=httpx.Timeout(10.0, connect=1.0),
+        limits=httpx.Limits(
+            max_connections=64,
+            max_keepalive_connections=32,
+            keepalive_expiry=30.0,
+        ),
+    )
+
+
+# Shared HTTP client for Dapr. Recreated on startup and closed on shutdown
+# by the app lifespan.
+dapr_client = create_dapr_client()
+
+# How long a Dapr health probe result is reused before probing again
+DAPR_HEALTH_TTL_SECONDS = 5.0
+
+# Last Dapr health probe result (available is None until the first probe)
+_dapr_health: dict[str, Any] = {"available": None, "checked_at": 0.0}
 
 
 class StateItem(BaseModel):
@@ -42,12 +74,50 @@ class SaveStateRequest(BaseModel):
 
 
 async def is_dapr_available() -> bool:
-    """Check if Dapr sidecar is available."""
+    """
+    Check if Dapr sidecar is available.
+    The result is cached for DAPR_HEALTH_TTL_SECONDS so state operations
+    don't probe the sidecar before every call.
+    """
+    now = time.monotonic()
+    if (
+        _dapr_health["available"] is not None
+        and now - _dapr_health["checked_at"] < DAPR_HEALTH_TTL_SECONDS
+    ):
+        return _dapr_health["available"]
+
     try:
-        response = await dapr_client.get(f"{DAPR_URL}/v1.0/healthz")
-        return response.status_code == 204
+        response = await dapr_client.get("/v1.0/healthz")
+        available = response.status_code == 204
     except Exception:
-        return False
+        available = False
+
+    _dapr_health["available"] = available
+    _dapr_health["checked_at"] = now
+    return available
+
+
+def _invalidate_dapr_health() -> None:
+    """Force the next is_dapr_available() call to probe the sidecar."""
+    _dapr_health["available"] = None
+
+
+def _validation_error(loc: tuple, msg: str, error_type: str) -> RequestValidationError:
+    """Build a 422 error in FastAPI's usual list-of-errors shape."""
+    return RequestValidationError([
+        {"type": error_type, "loc": loc, "msg": msg, "input": None}
+    ])
+
+
+def _encode(value: Any, loc: tuple) -> bytes:
+    """
+    Encode a value with orjson, rejecting values it cannot represent
+    (e.g. integers beyond 64 bits) with a 422 so they are never stored.
+    """
+    try:
+        return orjson.dumps(value)
+    except TypeError as e:
+        raise _validation_error(loc, f"Value cannot be stored: {e}", "json_encode_error")
 
 
 @router.get("/health")
@@ -73,12 +143,13 @@ async def get_state(key: str, tenant_id: str | None = None):
     if await is_dapr_available():
         try:
             response = await dapr_client.get(
-                f"{DAPR_URL}/v1.0/state/{settings.state_store_name}/{full_key}"
+                f"{STATE_PATH}/{full_key}"
             )
             if response.status_code == 204:
                 return {"key": key, "value": None}
-            return {"key": key, "value": response.json()}
+            return {"key": key, "value": orjson.loads(response.content)}
         except Exception as e:
+            _invalidate_dapr_health()
             logger.error(f"Dapr state get failed: {e}")
             raise HTTPException(status_code=500, detail="Failed to retrieve state")
     else:
@@ -95,31 +166,20 @@ async def save_state(request: SaveStateRequest, tenant_id: str | None = None):
     """
     tenant = tenant_id or settings.atlan_tenant_id
 
-    if await is_dapr_available():
-        try:
-            # Format for Dapr bulk save
-            dapr_items = [
-                {
-                    "key": f"{tenant}:{item.key}",
-                    "value": item.value
-                }
-                for item in request.items
-            ]
-
-            response = await dapr_client.post(
-                f"{DAPR_URL}/v1.0/state/{settings.state_store_name}",
-                json=dapr_items
-            )
+    # Encode each value once; this also rejects values that could be saved
+    # but not read back
+    encoded = [
+        _encode(item.value, ("body", "items", i, "value"))
+        for i, item in enumerate(request.items)
+    ]
 
-            if response.status_code not in [200, 201, 204]:
-                raise HTTPException(status_code=500, detail="Failed to save state to Dapr")
-
-            return {"saved": len(request.items), "storage": "dapr"}
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Dapr state save failed: {e}")
-            raise HTTPException(status_code=500, detail="Failed to save state")
+    if await is_dapr_available():
+        # Format for Dapr bulk save
+        await _post_entries([
+            _state_entry(f"{tenant}:{item.key}", value)
+            for item, value in zip(request.items, encoded)
+        ])
+        return {"saved": len(request.items), "storage": "dapr"}
     else:
         # Fallback to memory
         for item in request.items:
@@ -140,10 +200,11 @@ async def delete_state(key: str, tenant_id: str | None = None):
     if await is_dapr_available():
         try:
             response = await dapr_client.delete(
-                f"{DAPR_URL}/v1.0/state/{settings.state_store_name}/{full_key}"
+                f"{STATE_PATH}/{full_key}"
             )
             return {"deleted": key}
         except Exception as e:
+            _invalidate_dapr_health()
             logger.error(f"Dapr state delete failed: {e}")
             raise HTTPException(status_code=500, detail="Failed to delete state")
     else:
@@ -152,53 +213,258 @@ async def delete_state(key: str, tenant_id: str | None = None):
         return {"deleted": key}
 
 
+def _state_entry(full_key: str, encoded: bytes, ttl_seconds: int | None = None) -> bytes:
+    """Build one Dapr save entry around an already-encoded value."""
+    entry = b'{"key":' + orjson.dumps(full_key) + b',"value":' + encoded
+    if ttl_seconds is not None:
+        entry += b',"metadata":{"ttlInSeconds":"%d"}' % ttl_seconds
+    return entry + b"}"
+
+
+async def _post_entries(entries: list[bytes]) -> None:
+    """Save pre-encoded entries to Dapr in a single request."""
+    try:
+        response = await dapr_client.post(
+            STATE_PATH,
+            content=b"[" + b",".join(entries) + b"]",
+            headers=JSON_HEADERS
+        )
+    except Exception as e:
+        _invalidate_dapr_health()
+        logger.error(f"Dapr state save failed: {e}")
+        raise HTTPException(status_code=500, detail="Failed to save state")
+
+    if response.status_code not in [200, 201, 204]:
+        raise HTTPException(status_code=500, detail="Failed to save state to Dapr")
+
+
+async def _write_value(
+    full_key: str,
+    value: Any,
+    use_dapr: bool,
+    ttl_seconds: int | None = None,
+    loc: tuple = ("body",),
+) -> None:
+    """Save a single value directly, without building a SaveStateRequest."""
+    encoded = _encode(value, loc)
+
+    if use_dapr:
+        await _post_entries([_state_entry(full_key, encoded, ttl_seconds)])
+    else:
+        _memory_store[full_key] = value
+
+
+async def _read_values(full_keys: list[str], use_dapr: bool) -> dict[str, Any]:
+    """
+    Read several keys in one call (Dapr bulk state API when available).
+    Keys that have no value are left out of the result.
+    """
+    if not use_dapr:
+        return {k: _memory_store[k] for k in full_keys if k in _memory_store}
+
+    try:
+        response = await dapr_client.post(
+            f"{STATE_PATH}/bulk",
+            content=orjson.dumps({"keys": full_keys, "parallelism": 8}),
+            headers=JSON_HEADERS
+        )
+        response.raise_for_status()
+        items = orjson.loads(response.content)
+    except Exception as e:
+        _invalidate_dapr_health()
+        logger.error(f"Dapr state bulk get failed: {e}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve state")
+
+    return {item["key"]: item["data"] for item in items if item.get("data") is not None}
+
+
 # ============================================================================
 # Trend Data Endpoints (for historical quality data)
 # ============================================================================
 
-@router.get("/trends/daily")
-async def get_daily_trends(days: int = 90, tenant_id: str | None = None):
-    """Get daily aggregation trend data."""
-    key = "daily_aggregations"
-    result = await get_state(key, tenant_id)
+# Daily aggregations are stored one key per UTC day: daily_aggregations:YYYY-MM-DD
+DAILY_AGGREGATION_KEY = "daily_aggregations"
 
-    if not result["value"]:
-        return {"aggregations": []}
+# Days of trend history kept (each day's key expires after this)
+DAILY_AGGREGATION_RETENTION_DAYS = 365
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Largest daily aggregation body accepted; larger bodies are rejected unparsed
+DAILY_AGGREGATION_MAX_BYTES = 256 * 1024
+
+
+def _aggregation_day(aggregation: dict) -> str:
+    """
+    Resolve the zero-padded YYYY-MM-DD day an aggregation belongs to,
+    matching the keys get_daily_trends reads.
+    """
+    date = aggregation.get("date")
+    if isinstance(date, str):
+        try:
+            if len(date) <= 10:
+                return time.strftime("%Y-%m-%d", time.strptime(date, "%Y-%m-%d"))
+            # Full datetimes: take the UTC day, not the local day of the offset
+            parsed = datetime.fromisoformat(date.replace("Z", "+00:00"))
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone(timezone.utc)
+            return parsed.date().isoformat()
+        except (ValueError, OverflowError):
+            pass
+
+    timestamp = aggregation.get("timestamp")
+    if timestamp is None:
+        return time.strftime("%Y-%m-%d", time.gmtime())
+    if isinstance(timestamp, bool) or not isinstance(timestamp, (int, float)):
+        raise _validation_error(
+            ("body", "timestamp"), "Timestamp must be epoch milliseconds", "number_type"
+        )
 
-    aggregations = result["value"]
-    if isinstance(aggregations, list):
-        # Filter to requested days
-        cutoff = datetime.now().timestamp() * 1000 - (days * 24 * 60 * 60 * 1000)
-        filtered = [a for a in aggregations if a.get("timestamp", 0) > cutoff]
-        return {"aggregations": filtered}
+    try:
+        day = time.gmtime(timestamp / 1000)
+    except (OverflowError, OSError, ValueError):
+        day = None
+    if day is None or timestamp < 0 or day.tm_year > 9999:
+        raise _validation_error(
+            ("body", "timestamp"), "Timestamp is out of range", "value_error"
+        )
+    return time.strftime("%Y-%m-%d", day)
 
-    return {"aggregations": []}
 
+# (tenant, use_dapr) pairs whose legacy single-key history has been split up
+_migrated_trend_tenants: set[tuple[str, bool]] = set()
 
-@router.post("/trends/daily")
-async def save_daily_aggregation(aggregation: dict, tenant_id: str | None = None):
-    """Save a daily aggregation to trend data."""
-    key = "daily_aggregations"
-    result = await get_state(key, tenant_id)
 
-    existing = result["value"] or []
-    if not isinstance(existing, list):
-        existing = []
+async def _migrate_legacy_trends(tenant: str, use_dapr: bool) -> None:
+    """
+    Split history saved under the old single key ({tenant}:daily_aggregations,
+    a list of aggregations) into per-day keys, then delete the old key.
+    Days already written under the per-day layout are left as they are.
+    """
+    if (tenant, use_dapr) in _migrated_trend_tenants:
+        return
+
+    legacy_key = f"{tenant}:{DAILY_AGGREGATION_KEY}"
+    legacy = (await _read_values([legacy_key], use_dapr)).get(legacy_key)
+
+    if isinstance(legacy, list):
+        now = time.time()
+        retention_seconds = DAILY_AGGREGATION_RETENTION_DAYS * SECONDS_PER_DAY
+        by_key: dict[str, tuple[Any, int]] = {}
+        for aggregation in legacy:
+            if not isinstance(aggregation, dict):
+                continue
+            try:
+                day = _aggregation_day(aggregation)
+            except RequestValidationError:
+                continue
+            # Expire each day when it would have left the retention window
+            day_start = calendar.timegm(time.strptime(day, "%Y-%m-%d"))
+            ttl_seconds = min(int(day_start + retention_seconds - now), retention_seconds)
+            if ttl_seconds > 0:
+                # Later entries win, as they did in the old list
+                by_key[f"{legacy_key}:{day}"] = (aggregation, ttl_seconds)
+
+        existing = await _read_values(list(by_key), use_dapr) if by_key else {}
+        missing = {k: v for k, v in by_key.items() if k not in existing}
+
+        if use_dapr:
+            entries = []
+            for full_key, (aggregation, ttl_seconds) in missing.items():
+                try:
+                    encoded = _encode(aggregation, ("body",))
+                except RequestValidationError:
+                    continue
+                entries.append(_state_entry(full_key, encoded, ttl_seconds))
+            if entries:
+                await _post_entries(entries)
+        else:
+            for full_key, (aggregation, _) in missing.items():
+                _memory_store[full_key] = aggregation
+
+    if legacy is not None:
+        await delete_state(DAILY_AGGREGATION_KEY, tenant)
+
+    _migrated_trend_tenants.add((tenant, use_dapr))
 
-    # Add new aggregation
-    existing.append(aggregation)
 
-    # Keep last 365 days
-    if len(existing) > 365:
-        existing = existing[-365:]
+@router.get("/trends/daily")
+async def get_daily_trends(days: int = 90, tenant_id: str | None = None):
+    """
+    Get daily aggregation trend data, oldest first.
+    Only the keys for the requested days are fetched.
+    """
+    tenant = tenant_id or settings.atlan_tenant_id
+    days = max(0, min(days, DAILY_AGGREGATION_RETENTION_DAYS))
+
+    now = time.time()
+    full_keys = [
+        f"{tenant}:{DAILY_AGGREGATION_KEY}:"
+        + time.strftime("%Y-%m-%d", time.gmtime(now - offset * SECONDS_PER_DAY))
+        for offset in range(days - 1, -1, -1)
+    ]
+    if not full_keys:
+        return {"aggregations": []}
+
+    use_dapr = await is_dapr_available()
+    await _migrate_legacy_trends(tenant, use_dapr)
+
+    values = await _read_values(full_keys, use_dapr)
+    return {"aggregations": [values[k] for k in full_keys if k in values]}
+
+
+@router.post(
+    "/trends/daily",
+    # The body is read raw (see below), so document it explicitly
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {
+                        "type": "object",
+                        "title": "Aggregation",
+                        "additionalProperties": True,
+                    }
+                }
+            },
+        }
+    },
+)
+async def save_daily_aggregation(request: Request, tenant_id: str | None = None):
+    """
+    Save a daily aggregation to trend data.
+    Replaces any aggregation already saved for the same day. Bodies over
+    DAILY_AGGREGATION_MAX_BYTES are rejected before they are parsed.
+    """
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > DAILY_AGGREGATION_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Aggregation payload too large")
+
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > DAILY_AGGREGATION_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="Aggregation payload too large")
 
-    # Save back
-    await save_state(
-        SaveStateRequest(items=[StateItem(key=key, value=existing)]),
-        tenant_id
+    try:
+        aggregation = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise _validation_error(("body", 0), "JSON decode error", "json_invalid")
+    if not isinstance(aggregation, dict):
+        raise _validation_error(("body",), "Aggregation must be a JSON object", "dict_type")
+
+    day = _aggregation_day(aggregation)
+    full_key = f"{tenant_id or settings.atlan_tenant_id}:{DAILY_AGGREGATION_KEY}:{day}"
+
+    await _write_value(
+        full_key,
+        aggregation,
+        await is_dapr_available(),
+        ttl_seconds=DAILY_AGGREGATION_RETENTION_DAYS * SECONDS_PER_DAY,
     )
 
-    return {"saved": True, "total_aggregations": len(existing)}
+    return {"saved": True, "date": day}
 
 
 @router.get("/session")
@@ -211,11 +477,9 @@ async def get_session(tenant_id: str | None = None):
 @router.post("/session")
 async def save_session(session: dict, tenant_id: str | None = None):
     """Save session state for resume functionality."""
-    session["lastActiveTimestamp"] = int(datetime.now().timestamp() * 1000)
+    session["lastActiveTimestamp"] = int(time.time() * 1000)
 
-    await save_state(
-        SaveStateRequest(items=[StateItem(key="session", value=session)]),
-        tenant_id
-    )
+    full_key = f"{tenant_id or settings.atlan_tenant_id}:session"
+    await _write_value(full_key, session, await is_dapr_available())
 
     return {"saved": True}